@@ -1,8 +1,13 @@
 #!/usr/bin/env python3
 import os
+import io
 import sys
+import re
 import json
+import functools
+import itertools
 import argparse
+from multiprocessing import Pool
 from urllib.parse import urlparse
 import tldextract
 
@@ -25,6 +30,37 @@ EXT_LIST = B_EXT + C_EXT
 # Determine base directory once
 BASE_DIR = os.path.dirname(os.path.realpath(__file__))
 
+# Below this many URLs a process pool costs more than it saves
+SERIAL_THRESHOLD = 64
+# URLs per pool task; each task returns one merged set
+URL_BATCH = 32
+
+# Placeholders rewritten to str.format_map fields at load time ($full_path before $path)
+_PLACEHOLDER_RE = re.compile(
+    r'\$(domain_name|full_domain|subdomain|full_path|path|file_name|tld'
+    r'|word|num|b_ext|c_ext|ext)|%([ymd])'
+)
+STATIC_FIELDS = frozenset(
+    ('domain_name', 'full_domain', 'subdomain', 'full_path', 'path', 'file_name', 'tld')
+)
+
+# Host part of a URL without a netloc, as tldextract splits it
+_BARE_HOST_RE = re.compile(r'[^/?#]*')
+
+# Templated tokens expanded from a precomputed "word.ext" table in one field
+FUSED_TOKENS = {
+    '$word.$ext': (('$word', '$ext'), 'word_ext'),
+    '$word.$b_ext': (('$word', '$b_ext'), 'word_b_ext'),
+    '$word.$c_ext': (('$word', '$c_ext'), 'word_c_ext'),
+}
+
+# Output is written in newline-joined batches through a 1 MB buffer
+OUTPUT_BUFFER = 1 << 20
+WRITE_BATCH = 4096
+
+# Build the extractor once; use the bundled suffix list snapshot, no disk cache
+_TLD = tldextract.TLDExtract(suffix_list_urls=(), cache_dir=False)
+
 
 def setup_argparse():
     parser = argparse.ArgumentParser(description="Fback")
@@ -38,6 +74,9 @@ def setup_argparse():
     parser.add_argument('-dr', help='Days ranges in wordlist')
     parser.add_argument('-r', '--relative', action='store_true',
                         help='Output only the path/filename (no scheme://domain prefix)')
+    parser.add_argument('-s', '--stream', action='store_true',
+                        help='Write results per batch of URLs as they finish, deduplicated per '
+                             'batch only (pipe through sort -u for global uniqueness)')
     return parser.parse_args()
 
 
@@ -57,109 +96,237 @@ def generate_variables(arg_str):
 
 
 def load_patterns(pattern_path):
-    """Load and flatten patterns JSON."""
+    """Load, flatten and compile patterns JSON into a tuple shared by workers."""
     data = read_file(pattern_path, 'json')
-    return [item for sub in data.values() for item in sub]
+    compiled = (compile_pattern(item) for sub in data.values() for item in sub)
+    # Leftover '$'/'%' would be filtered from every result anyway
+    return tuple(dict.fromkeys(
+        (template, fields) for template, fields in compiled
+        if '$' not in template and '%' not in template
+    ))
+
+
+def compile_pattern(pattern):
+    """Rewrite a pattern into a template and its dynamic fields.
+
+    Static placeholders become named fields, filled per URL by
+    static_replace; dynamic ones become '_<i>' fields that static_replace
+    turns into positional '{i}' slots. Literal braces are escaped for both
+    formatting passes. A fused token is only used when it accounts for every
+    occurrence of its parts, so the same word/extension is still shared
+    across the pattern.
+    """
+    fields = []
+
+    def field(name):
+        if name in STATIC_FIELDS:
+            return '{%s}' % name
+        if name not in fields:
+            fields.append(name)
+        return '{_%d}' % fields.index(name)
+
+    template = pattern.replace('{', '{{{{').replace('}', '}}}}')
+    for token, (parts, name) in FUSED_TOKENS.items():
+        n = template.count(token)
+        if n and all(template.count(part) == n for part in parts):
+            template = template.replace(token, field(name))
+    template = _PLACEHOLDER_RE.sub(lambda m: field(m.group(1) or m.group(2)), template)
+    return template, tuple(fields)
 
 
 def load_urls(list_arg):
-    """Read URLs either from a file or stdin."""
+    """Stream URLs from a file or stdin, skipping blank lines."""
     if list_arg:
-        return read_file(list_arg, 'list')
-    return sys.stdin.read().rstrip().splitlines()
+        with open(os.path.join(BASE_DIR, list_arg), 'r',
+                  buffering=OUTPUT_BUFFER, encoding='utf-8') as f:
+            yield from _stripped_lines(f)
+    else:
+        yield from _stripped_lines(sys.stdin)
+
+
+def _stripped_lines(f):
+    for line in f:
+        line = line.rstrip()
+        if line:
+            yield line
 
 
 def extract_url_parts(url):
     """Parse URL into its components."""
-    ext = tldextract.extract(url)
     parsed = urlparse(url)
+    # Bare hosts ("example.com/x") have no netloc; key on what tldextract reads
+    netloc = parsed.netloc or _BARE_HOST_RE.match(url).group()
+    return {**_host_parts(parsed.scheme, netloc), **_path_parts(parsed.path)}
+
+
+@functools.lru_cache(maxsize=4096)
+def _host_parts(scheme, netloc):
+    """Split a host into domain parts; cached since URL lists repeat hosts."""
+    ext = _TLD(f"{scheme}://{netloc}" if scheme else netloc)
     domain, sub, suffix = ext.domain, ext.subdomain, ext.suffix
-    scheme = parsed.scheme
-    full_domain = f"{sub + '.' if sub else ''}{domain}.{suffix}"
-    path = parsed.path
     return {
         'domain_name': domain,
         'scheme': scheme,
         'subdomain': sub,
         'tld': suffix,
-        'full_domain': full_domain,
-        'path': os.path.dirname(path),
+        'full_domain': f"{sub + '.' if sub else ''}{domain}.{suffix}",
+    }
+
+
+def _path_parts(path):
+    """Split a URL path into directory, full path and file name."""
+    cut = path.rfind('/') + 1
+    head, base = path[:cut], path[cut:]
+    if head.strip('/'):
+        head = head.rstrip('/')
+    return {
+        'path': head,
         'full_path': path,
-        'file_name': os.path.basename(path) if '.' in os.path.basename(path) else ''
+        'file_name': base if '.' in base else ''
     }
 
 
+class _PositionalFields(dict):
+    """format_map context that turns '_<i>' fields into positional '{i}' slots."""
+
+    def __missing__(self, key):
+        return '{%s}' % key[1:]
+
+
 def static_replace(patterns, vars_dict):
-    """Replace static placeholders in patterns."""
-    mapping = {
-        '$domain_name': vars_dict['domain_name'],
-        '$subdomain': vars_dict['subdomain'],
-        '$tld': vars_dict['tld'],
-        '$full_domain': vars_dict['full_domain'],
-        '$path': vars_dict['path'],
-        '$full_path': vars_dict['full_path'],
-        '$file_name': vars_dict['file_name'],
-    }
+    """Fill this URL's static fields, dropping templates that then coincide."""
+    ctx = _PositionalFields(
+        (k, v.replace('{', '{{').replace('}', '}}')) for k, v in vars_dict.items()
+    )
     out = []
     seen = set()
-    for p in patterns:
-        s = p
-        for key, val in mapping.items():
-            s = s.replace(key, val)
-        if s not in seen:
-            seen.add(s)
-            out.append(s)
+    for template, fields in patterns:
+        # Positional slots drop field names, so fields are part of the key
+        key = (template.format_map(ctx), fields)
+        if key not in seen:
+            seen.add(key)
+            out.append(key)
     return out
 
 
-def dynamic_replace(patterns, values, placeholder):
-    """Replace one dynamic placeholder with all provided values."""
-    out = []
-    seen = set()
-    for p in patterns:
-        for v in values:
-            s = p.replace(placeholder, str(v))
-            if s not in seen:
-                seen.add(s)
-                out.append(s)
-    return out
+def expand(template, fields, values):
+    """Iterate the template formatted with every combination of field values.
+
+    starmap/product/str.format keep the per-string loop in C.
+    """
+    if any(f not in values for f in fields):
+        # e.g. %y without -yr: every result would keep the raw placeholder
+        return ()
+    return itertools.starmap(
+        template.format, itertools.product(*(values[f] for f in fields))
+    )
 
 
 def clean_result(results, scheme, domain, relative=False):
     """Normalize slashes and add prefix if needed."""
-    out = []
     prefix = f"{scheme}://{domain}"
+    if not relative and ('%' in prefix or '$' in prefix):
+        return
     for w in results:
-        w = w.replace('//', '/')
+        if '//' in w:
+            w = w.replace('//', '/')
         if relative:
-            out.append(w.lstrip('/'))
+            yield w.lstrip('/')
         else:
             if not w.startswith('/'):
                 w = '/' + w
-            out.append(f"{prefix}{w}")
-    return out
+            yield f"{prefix}{w}"
+
 
+def dynamic_values(patterns, wordlist, args, years, months, days):
+    """Map each dynamic field used by patterns to its values.
 
-def create_wordlist(patterns, wordlist, args, vars_dict, years, months, days):
-    """Generate complete wordlist for a single URL."""
-    pats = static_replace(patterns, vars_dict)
-    pats = dynamic_replace(pats, wordlist, '$word')
-    pats = dynamic_replace(pats, EXT_LIST, '$ext')
-    pats = dynamic_replace(pats, range(1, args.n + 1), '$num')
+    Unused fields (and unset date ranges) are omitted, so the word x
+    extension tables are only built when some pattern needs them.
+    """
+    used = {f for _, fields in patterns for f in fields}
+    values = {
+        'word': wordlist,
+        'ext': EXT_LIST,
+        'num': [str(x) for x in range(1, args.n + 1)],
+        'b_ext': B_EXT,
+        'c_ext': C_EXT,
+    }
+    for name, exts in (('word_ext', EXT_LIST), ('word_b_ext', B_EXT), ('word_c_ext', C_EXT)):
+        if name in used:
+            values[name] = [f"{w}.{e}" for w in wordlist for e in exts]
     if years:
-        pats = dynamic_replace(pats, years, '%y')
+        values['y'] = years
     if months:
-        pats = dynamic_replace(pats, months, '%m')
+        values['m'] = months
     if days:
-        pats = dynamic_replace(pats, days, '%d')
-    # Additional extensions
-    if any('$b_ext' in p for p in pats):
-        pats = dynamic_replace(pats, B_EXT, '$b_ext')
-    if any('$c_ext' in p for p in pats):
-        pats = dynamic_replace(pats, C_EXT, '$c_ext')
+        values['d'] = days
+    return {f: v for f, v in values.items() if f in used}
+
+
+def create_wordlist(patterns, values, args, vars_dict):
+    """Lazily generate the complete wordlist for a single URL."""
+    pats = (
+        w
+        for template, fields in static_replace(patterns, vars_dict)
+        for w in expand(template, fields, values)
+        # Drop strings whose URL parts or words carry placeholder characters
+        if '%' not in w and '$' not in w
+    )
     return clean_result(pats, vars_dict['scheme'], vars_dict['full_domain'], args.relative)
 
 
+def write_lines(stream, lines):
+    """Write lines to a binary stream in newline-joined batches."""
+    lines = iter(lines)
+    while True:
+        batch = list(itertools.islice(lines, WRITE_BATCH))
+        if not batch:
+            break
+        stream.write(('\n'.join(batch) + '\n').encode('utf-8'))
+
+
+_worker_ctx = None
+
+
+def _init_worker(patterns, values, args):
+    """Stash shared run state in module globals for _worker."""
+    global _worker_ctx
+    _worker_ctx = (patterns, values, args)
+
+
+def _worker(urls):
+    """Generate the merged, deduplicated wordlist for a batch of URLs."""
+    patterns, values, args = _worker_ctx
+    unique = set()
+    for url in urls:
+        unique.update(create_wordlist(patterns, values, args, extract_url_parts(url)))
+    return unique
+
+
+def _batched(iterable, n):
+    """Yield lists of up to n items from iterable."""
+    it = iter(iterable)
+    while True:
+        batch = list(itertools.islice(it, n))
+        if not batch:
+            break
+        yield batch
+
+
+def url_results(urls, initargs):
+    """Yield the wordlist set of each batch of URLs, in a process pool for long lists."""
+    head = list(itertools.islice(urls, SERIAL_THRESHOLD))
+    if len(head) < SERIAL_THRESHOLD:
+        _init_worker(*initargs)
+        for batch in _batched(head, URL_BATCH):
+            yield _worker(batch)
+    else:
+        batches = _batched(itertools.chain(head, urls), URL_BATCH)
+        with Pool(initializer=_init_worker, initargs=initargs) as pool:
+            yield from pool.imap_unordered(_worker, batches)
+
+
 def main():
     args = setup_argparse()
     patterns = load_patterns(args.p or 'res/patterns.json')
@@ -171,22 +338,29 @@ def main():
     days = generate_variables(args.dr)
     urls = load_urls(args.l)
 
-    unique = set()
-    for url in urls:
-        vars_dict = extract_url_parts(url)
-        wl = create_wordlist(patterns, wordlist, args, vars_dict, years, months, days)
-        unique.update(wl)
+    initargs = (patterns, dynamic_values(patterns, wordlist, args, years, months, days), args)
+    results = url_results(urls, initargs)
+    if not args.stream:
+        unique = set()
+        for wl in results:
+            unique.update(wl)
+        results = [unique]
 
+    sys.stdout.flush()
+    out = io.BufferedWriter(sys.stdout.buffer, buffer_size=OUTPUT_BUFFER)
+    sinks = [out]
     # Save to file if requested
     if args.o:
-        with open(args.o, 'w', encoding='utf-8') as f:
-            f.write('\n'.join(u for u in unique if '%' not in u and '$' not in u))
-
-    # Output to stdout
-    write = sys.stdout.write
-    for u in unique:
-        if '%' not in u and '$' not in u:
-            write(u + '\n')
+        sinks.insert(0, open(args.o, 'wb', buffering=OUTPUT_BUFFER))
+    try:
+        for wl in results:
+            for sink in sinks:
+                write_lines(sink, wl)
+    finally:
+        if args.o:
+            sinks[0].close()
+        out.flush()
+        out.detach()
 
 
 if __name__ == '__main__':